@@ -19,9 +19,17 @@
 
 """Tests for the cli module"""
 
+import argparse
 import importlib
+from io import BytesIO
+from unittest.mock import DEFAULT, Mock, patch
 from ..tools import LoggedTestCase
-from umake.ui.cli import mangle_args_for_default_framework
+from umake.interactions import LicenseAgreement, TextWithChoices, YesNo
+from umake.network.download_center import DownloadCenter
+from umake.tools import InputError, MainLoop, Singleton
+from umake.ui import UI
+from umake.ui.cli import mangle_args_for_default_framework, is_first_version_higher, is_metadata_command, \
+    get_default_args_for_framework, add_categories_subparsers, fetch_package_urls, CliUI
 import os
 import sys
 from ..tools import get_data_dir, change_xdg_path, patchelem
@@ -205,3 +213,211 @@ class TestCLIFromFrameworks(LoggedTestCase):
         """We mangle the -r remove option if global (before the category name) to append it to the framework option"""
         self.assertEqual(mangle_args_for_default_framework(["-r", "category-a", "framework-a"]),
                          ["category-a", "framework-a", "-r"])
+
+    def test_metadata_command(self):
+        """Global options not acting on frameworks are detected before any positional argument"""
+        self.assertTrue(is_metadata_command(["--version"]))
+        self.assertTrue(is_metadata_command(["-v", "--list"]))
+        self.assertFalse(is_metadata_command([]))
+        self.assertFalse(is_metadata_command(["-v", "category-a"]))
+        self.assertFalse(is_metadata_command(["category-a", "framework-a", "--list"]))
+
+    def test_default_args_for_framework(self):
+        """Args selecting a framework with default options are built without the command line parser"""
+        framework = frameworks.BaseCategory.categories["category-a"].frameworks["framework-b"]
+        args = get_default_args_for_framework(framework)
+        self.assertEqual(args.category, "category-a")
+        self.assertEqual(args.framework, "framework-b")
+        self.assertIsNone(args.destdir)
+        self.assertFalse(args.remove)
+        self.assertFalse(args.dry_run)
+
+    def _get_lazy_parser(self):
+        """Return a parser with all test categories lazily registered and its subparsers action"""
+        parser = argparse.ArgumentParser()
+        return parser, add_categories_subparsers(parser)
+
+    def test_lazy_parser_only_installs_selected_category(self):
+        """Only the selected category parser is built"""
+        parser, categories_parser = self._get_lazy_parser()
+        args = parser.parse_args(["category-a", "framework-b"])
+        self.assertEqual(args.category, "category-a")
+        self.assertEqual(args.framework, "framework-b")
+        self.assertIsInstance(categories_parser.choices["category-a"], argparse.ArgumentParser)
+        self.assertNotIsInstance(categories_parser.choices["category-f"], argparse.ArgumentParser)
+
+    def test_lazy_parser_install_all(self):
+        """All category parsers are built when requested"""
+        parser, categories_parser = self._get_lazy_parser()
+        categories_parser.install_all_pending_parsers()
+        for category_parser in categories_parser.choices.values():
+            self.assertIsInstance(category_parser, argparse.ArgumentParser)
+
+    def test_lazy_parser_main_category_framework(self):
+        """Main category frameworks are available without any category being built"""
+        parser, categories_parser = self._get_lazy_parser()
+        self.assertEqual(parser.parse_args(["framework-free-a"]).category, "framework-free-a")
+        self.assertNotIsInstance(categories_parser.choices["category-a"], argparse.ArgumentParser)
+
+    def test_lazy_parser_keeps_choices_order(self):
+        """Building a category parser doesn't change choices order"""
+        parser, categories_parser = self._get_lazy_parser()
+        initial_choices = list(categories_parser.choices)
+        parser.parse_args(["category-a", "framework-b"])
+        self.assertEqual(list(categories_parser.choices), initial_choices)
+
+    def test_lazy_parser_help_lists_categories(self):
+        """Help lists every category with its description before any category parser is built"""
+        parser, categories_parser = self._get_lazy_parser()
+        help_text = " ".join(parser.format_help().split())
+        for category in frameworks.BaseCategory.categories.values():
+            if category.is_main_category or not category.has_frameworks():
+                continue
+            self.assertIn("{} {}".format(category.prog_name, " ".join(category.description.split())), help_text)
+        # help doesn't change once category parsers are built
+        categories_parser.install_all_pending_parsers()
+        self.assertEqual(" ".join(parser.format_help().split()), help_text)
+
+
+class TestVersionComparison(LoggedTestCase):
+    """This will test version comparison used for updates"""
+
+    def test_higher_version(self):
+        """Higher version is detected on any component"""
+        self.assertTrue(is_first_version_higher("1.10.0", "1.9.3"))
+        self.assertTrue(is_first_version_higher("2.0", "1.99"))
+
+    def test_lower_or_equal_version(self):
+        """Lower or equal versions aren't higher"""
+        self.assertFalse(is_first_version_higher("1.9.3", "1.10.0"))
+        self.assertFalse(is_first_version_higher("1.2.3", "1.2.3"))
+
+    def test_longer_version(self):
+        """Longer version with the same prefix is higher"""
+        self.assertTrue(is_first_version_higher("1.2.1", "1.2"))
+        self.assertFalse(is_first_version_higher("1.2", "1.2.1"))
+
+    def test_none_version(self):
+        """Any version is higher than None"""
+        self.assertTrue(is_first_version_higher("1.0", None))
+        self.assertFalse(is_first_version_higher(None, "1.0"))
+
+
+class TestFetchPackageUrls(LoggedTestCase):
+    """This will test fetching frameworks download pages for updates"""
+
+    def setUp(self):
+        super().setUp()
+        self.parsed_pages = {}
+
+    def fake_download_center(self, urls, on_done, download=True, report=lambda x: None):
+        """Synchronously return each url as its page content"""
+        result = {item.url: DownloadCenter.DownloadResult(buffer=BytesIO(item.url.encode()), error=None, fd=None,
+                                                          final_url=item.url, cookies=None)
+                  for item in urls}
+        on_done(result)
+        report('all downloads finished')
+
+    def get_framework(self, name, download_page, side_effect=None):
+        """Return a framework recording the page content it parsed"""
+        framework = Mock()
+        framework.name = name
+        framework.download_page = download_page
+
+        def store_package_url(result):
+            if side_effect:
+                raise side_effect
+            self.parsed_pages[name] = result[download_page].buffer.read().decode()
+        framework.store_package_url.side_effect = store_package_url
+        return framework
+
+    @patch("umake.ui.cli.DownloadCenter")
+    def test_shared_download_page(self, download_center):
+        """Frameworks sharing a download page fetch it once and all parse it"""
+        download_center.side_effect = self.fake_download_center
+        fetch_package_urls([self.get_framework("a", "http://shared"), self.get_framework("b", "http://shared"),
+                            self.get_framework("c", "http://other")])
+
+        self.assertEqual(download_center.call_count, 1)
+        self.assertEqual([item.url for item in download_center.call_args[0][0]], ["http://shared", "http://other"])
+        self.assertEqual(self.parsed_pages, {"a": "http://shared", "b": "http://shared", "c": "http://other"})
+
+    @patch("umake.ui.cli.DownloadCenter")
+    def test_failing_framework(self, download_center):
+        """A framework failing to parse its page doesn't prevent the others to be checked"""
+        self.expect_warn_error = True
+        download_center.side_effect = self.fake_download_center
+        fetch_package_urls([self.get_framework("a", "http://a", side_effect=ValueError("can't parse")),
+                            self.get_framework("b", "http://b", side_effect=MainLoop.ReturnMainLoop()),
+                            self.get_framework("c", "http://c")])
+
+        self.assertEqual(self.parsed_pages, {"c": "http://c"})
+
+    @patch("umake.ui.cli.DownloadCenter")
+    def test_no_framework(self, download_center):
+        """Nothing is fetched without any framework"""
+        fetch_package_urls([])
+
+        self.assertFalse(download_center.called)
+
+
+class TestCliUIDisplay(LoggedTestCase):
+    """This will test the CLI UI dispatching content types to their display handler"""
+
+    def setUp(self):
+        super().setUp()
+        self.handlers_patcher = patch.multiple(CliUI, _display_input_text=DEFAULT,
+                                               _display_license_agreement=DEFAULT,
+                                               _display_text_with_choices=DEFAULT, _display_message=DEFAULT,
+                                               _display_unknown_progress=DEFAULT)
+        self.handlers = self.handlers_patcher.start()
+        self.ui = CliUI()
+
+    def tearDown(self):
+        self.handlers_patcher.stop()
+        Singleton._instances = {}
+        UI.currentUI = None
+        super().tearDown()
+
+    def assert_only_handler_called(self, handler_name, content):
+        """Assert that only handler_name was called, once with content"""
+        for name, handler in self.handlers.items():
+            if name == handler_name:
+                handler.assert_called_once_with(content)
+            else:
+                self.assertFalse(handler.called, "{} was called".format(name))
+
+    def test_display_text_with_choices(self):
+        """TextWithChoices is displayed by its handler"""
+        content = TextWithChoices("content")
+        self.ui._display(content)
+        self.assert_only_handler_called("_display_text_with_choices", content)
+
+    def test_display_yes_no(self):
+        """YesNo is displayed by its parent TextWithChoices handler, which is then remembered"""
+        content = YesNo("content", Mock(), Mock())
+        self.ui._display(content)
+        self.assert_only_handler_called("_display_text_with_choices", content)
+        self.assertIn(YesNo, self.ui._display_handlers)
+
+    def test_display_license_agreement(self):
+        """LicenseAgreement is displayed by its own handler, not the TextWithChoices one"""
+        content = LicenseAgreement("content", Mock(), Mock())
+        self.ui._display(content)
+        self.assert_only_handler_called("_display_license_agreement", content)
+
+    def test_display_retry_on_input_error(self):
+        """The handler is called again on invalid input"""
+        self.expect_warn_error = True
+        self.handlers["_display_text_with_choices"].side_effect = [InputError("invalid"), None]
+        self.ui._display(TextWithChoices("content"))
+        self.assertEqual(self.handlers["_display_text_with_choices"].call_count, 2)
+
+    @patch("umake.ui.cli.MainLoop")
+    def test_display_unknown_content(self, mainloop):
+        """Unknown content types aren't displayed and quit with an error"""
+        self.expect_warn_error = True
+        self.ui._display(object())
+        mainloop.return_value.quit.assert_called_once_with(status_code=1)
+        for name, handler in self.handlers.items():
+            self.assertFalse(handler.called, "{} was called".format(name))
@@ -432,6 +432,26 @@ class TestFrameworkLoader(BaseFrameworkLoader):
         args.list_installed = True
         self.assertTrue(get_frameworks_list_output(args).startswith("framework-a: Description for framework A"))
 
+    def test_iter_frameworks_without_matching_framework(self):
+        """Categories without any matching framework are yielded once, without framework"""
+        pairs = list(frameworks.iter_frameworks(lambda framework: False))
+        self.assertEqual(len(pairs), len(self.CategoryHandler.categories))
+        for category, framework in pairs:
+            self.assertIsNone(framework)
+            self.assertEqual(category["frameworks"], [])
+            self.assertEqual(category["has_frameworks"],
+                             self.CategoryHandler.categories[category["category_name"]].has_frameworks())
+
+    def test_iter_frameworks_matching_framework(self):
+        """Only matching frameworks are yielded with their category"""
+        pairs = [(category["category_name"], framework["framework_name"])
+                 for category, framework in frameworks.iter_frameworks(
+                     lambda framework: framework.prog_name == "framework-b")
+                 if framework is not None]
+        self.assertIn(("category-a", "framework-b"), pairs)
+        for category_name, framework_name in pairs:
+            self.assertEqual(framework_name, "framework-b")
+
     @patch("umake.frameworks.get_user_frameworks_path")
     def test_list_default_framework(self, get_user_frameworks_path):
         """List the correct items"""
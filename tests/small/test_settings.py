@@ -35,6 +35,7 @@ class TestVersionHandler(LoggedTestCase):
     def setUp(self):
         super().setUp()
         self.from_dev_opt = settings.from_dev
+        settings.get_version.cache_clear()
         self.version_dir = tempfile.mkdtemp()
         self.initial_env = os.environ.copy()
         self.initial_os_path_join = os.path.join
@@ -46,6 +47,7 @@ class TestVersionHandler(LoggedTestCase):
         # remove caching
         shutil.rmtree(self.version_dir)
         settings.from_dev = self.from_dev_opt
+        settings.get_version.cache_clear()
         # restore original environment. Do not use the dict copy which erases the object and doesn't have the magical
         # _Environ which setenv() for subprocess
         os.environ.clear()
@@ -387,6 +387,7 @@ def list_frameworks():
                 'is_installed': BaseCategory.NOT_INSTALLED or
                                 BaseCategory.PARTIALLY_INSTALLED or
                                 BaseCategory.FULLY_INSTALLED
+                'has_frameworks': True or False
                 'frameworks':
                     [
                         {
@@ -397,6 +398,7 @@ def list_frameworks():
                             'is_installable': True or False
                             'is_category_default': True or False
                             'only_for_removal': True or False
+                            'framework': the BaseFramework object itself
                         },
                     ]
             },
@@ -404,32 +406,53 @@ def list_frameworks():
     """
     categories_dict = list()
     for category in BaseCategory.categories.values():
-        frameworks_dict = list()
-        for framework in category.frameworks.values():
-            new_fram = {
-                "framework_name": framework.prog_name,
-                "framework_description": framework.description,
-                "install_path": framework.install_path,
-                "is_installed": framework.is_installed,
-                "is_installable": framework.is_installable,
-                "is_category_default": framework.is_category_default,
-                "only_for_removal": framework.only_for_removal
-            }
-
-            frameworks_dict.append(new_fram)
-
-        new_cat = {
-            "category_name": category.prog_name,
-            "category_description": category.description,
-            "is_installed": category.is_installed,
-            "frameworks": frameworks_dict
-        }
-
-        categories_dict.append(new_cat)
-
+        frameworks_dict = [_get_framework_description(framework) for framework in category.frameworks.values()]
+        categories_dict.append(_get_category_description(category, frameworks_dict))
     return categories_dict
 
 
+def iter_frameworks(predicate=None):
+    """Yield (category, framework) description pairs, as in list_frameworks(), for frameworks matching predicate
+
+    predicate is called with the framework object, so that descriptions are only built for matching frameworks.
+    The category description is shared by all its pairs and its "frameworks" list only contains matching ones.
+    A category without any matching framework is yielded once with None as framework, so that it can be listed.
+    """
+    for category in BaseCategory.categories.values():
+        new_cat = _get_category_description(category, [])
+        for framework in category.frameworks.values():
+            if predicate is not None and not predicate(framework):
+                continue
+            new_fram = _get_framework_description(framework)
+            new_cat["frameworks"].append(new_fram)
+            yield new_cat, new_fram
+        if not new_cat["frameworks"]:
+            yield new_cat, None
+
+
+def _get_category_description(category, frameworks_dict):
+    return {
+        "category_name": category.prog_name,
+        "category_description": category.description,
+        "is_installed": category.is_installed,
+        "has_frameworks": category.has_frameworks(),
+        "frameworks": frameworks_dict
+    }
+
+
+def _get_framework_description(framework):
+    return {
+        "framework_name": framework.prog_name,
+        "framework_description": framework.description,
+        "install_path": framework.install_path,
+        "is_installed": framework.is_installed,
+        "is_installable": framework.is_installable,
+        "is_category_default": framework.is_category_default,
+        "only_for_removal": framework.only_for_removal,
+        "framework": framework
+    }
+
+
 def load_frameworks(force_loading=False, load_user_frameworks=True):
     """Load all modules and assign to correct category"""
     main_category = MainCategory()
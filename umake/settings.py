@@ -17,6 +17,7 @@
 # this program; if not, write to the Free Software Foundation, Inc.,
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
 
+from functools import lru_cache
 import os
 import requests
 import re
@@ -33,8 +34,9 @@ UMAKE_FRAMEWORKS_ENVIRON_VARIABLE = "UMAKE_FRAMEWORKS"
 from_dev = False
 
 
+@lru_cache(maxsize=1)
 def get_version():
-    '''Get version depending if on dev or released version'''
+    '''Get version depending if on dev or released version (computed once per process)'''
     version = open(os.path.join(os.path.dirname(__file__), 'version'), 'r', encoding='utf-8').read().strip()
     if not from_dev:
         snap_appendix = ''
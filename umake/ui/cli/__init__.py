@@ -20,10 +20,13 @@
 """Module for loading the command line interface"""
 
 import threading
-import argcomplete
+import argparse
 from contextlib import suppress
+from functools import lru_cache, partial
+from itertools import groupby
 from gettext import gettext as _
 import logging
+from operator import itemgetter
 import os
 from progressbar import ProgressBar, BouncingBar
 import readline
@@ -31,60 +34,160 @@ import sys
 from umake.interactions import InputText, TextWithChoices, LicenseAgreement, DisplayMessage, UnknownProgress
 from umake.network.download_center import DownloadItem, DownloadCenter
 from umake.ui import UI
-from umake.frameworks import BaseCategory, list_frameworks
-from umake.tools import InputError, MainLoop
+from umake.frameworks import BaseCategory, iter_frameworks, list_frameworks
+from umake.tools import InputError, MainLoop, is_completion_mode
 from umake.settings import get_version
 
 logger = logging.getLogger(__name__)
 
+_METADATA_OPTIONS = frozenset(("--version", "-l", "--list", "--list-installed", "--list-available", "--list-json",
+                               "-u", "--update"))
+_SUPPORTS_COLOR = None
+
+
+# text inserted by _rlinput_hook when readline starts a new prompt
+_rlinput_prefill = ['']
+
+
+def _rlinput_hook():
+    readline.insert_text(_rlinput_prefill[0])
+
 
 def rlinput(prompt, prefill=''):
-    readline.set_startup_hook(lambda: readline.insert_text(prefill))
+    _rlinput_prefill[0] = prefill
+    readline.set_startup_hook(_rlinput_hook)
     try:
         return input(prompt + " ")
     finally:
         readline.set_startup_hook()
 
 
+class _LazySubParsersAction(argparse._SubParsersAction):
+    """Subparsers action only building a category parser once it is selected
+
+    Categories are registered with a callable installing their parser and frameworks subparsers. The name and its
+    help are reserved upfront so that argparse accepts and lists it, and the real parser replaces it on first use.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pending_installers = {}
+
+    def add_lazy_parser(self, name, installer, help=None):
+        """Register installer to be called the first time name is selected"""
+        self._pending_installers[name] = installer
+        self._name_parser_map[name] = installer
+        if help is not None:
+            self._choices_actions.append(self._ChoicesPseudoAction(name, (), help))
+
+    def install_pending_parser(self, name):
+        """Install the real parser for name if it wasn't yet"""
+        installer = self._pending_installers.pop(name, None)
+        if installer is None:
+            return
+        # install in temporary containers, so that the parser replaces the reserved choice in place (keeping choices
+        # order) and the help registered upfront isn't duplicated
+        name_parser_map, choices_actions = self._name_parser_map, self._choices_actions
+        self._name_parser_map, self._choices_actions = {}, []
+        try:
+            installer()
+            name_parser_map[name] = self._name_parser_map[name]
+        finally:
+            self._name_parser_map, self._choices_actions = name_parser_map, choices_actions
+
+    def install_all_pending_parsers(self):
+        """Install every pending parser (needed for help and shell completion)"""
+        for name in list(self._pending_installers):
+            self.install_pending_parser(name)
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        self.install_pending_parser(values[0])
+        super().__call__(parser, namespace, values, option_string)
+
+
+def add_categories_subparsers(parser):
+    """Add categories subparsers to parser, each category parser only being built once selected
+
+    Return the categories subparsers action.
+    """
+    categories_parser = parser.add_subparsers(help='Developer environment', dest="category",
+                                              action=_LazySubParsersAction)
+    for category in BaseCategory.categories.values():
+        # main category frameworks are directly installed as top level commands
+        if category.is_main_category:
+            category.install_category_parser(categories_parser)
+        elif category.has_frameworks():
+            categories_parser.add_lazy_parser(category.prog_name,
+                                              partial(category.install_category_parser, categories_parser),
+                                              help=category.description)
+    return categories_parser
+
+
 class CliUI(UI):
 
     def __init__(self):
         # This this UI as current
         super().__init__(self)
+        self._display_handlers = {
+            InputText: self._display_input_text,
+            LicenseAgreement: self._display_license_agreement,
+            TextWithChoices: self._display_text_with_choices,
+            DisplayMessage: self._display_message,
+            UnknownProgress: self._display_unknown_progress,
+        }
 
     def _return_main_screen(self, status_code=0):
         # quit the shell
         MainLoop().quit(status_code=status_code)
 
+    def _get_display_handler(self, contentType):
+        """Return the handler for contentType type or its closest handled parent, None if there is none"""
+        content_class = type(contentType)
+        handler = self._display_handlers.get(content_class)
+        if handler is None:
+            for parent_class in content_class.__mro__[1:]:
+                handler = self._display_handlers.get(parent_class)
+                if handler is not None:
+                    # remember it for the next time this type is displayed
+                    self._display_handlers[content_class] = handler
+                    break
+        return handler
+
     def _display(self, contentType):
         # print depending on the content type
+        handler = self._get_display_handler(contentType)
+        if handler is None:
+            logger.error("Unexcepted content type to display to CLI UI: {}".format(contentType))
+            MainLoop().quit(status_code=1)
+            return
         while True:
             try:
-                if isinstance(contentType, InputText):
-                    contentType.run_callback(result=rlinput(contentType.content, contentType.default_input))
-                elif isinstance(contentType, LicenseAgreement):
-                    print(contentType.content)
-                    contentType.choose(answer=input(contentType.input))
-                elif isinstance(contentType, TextWithChoices):
-                    contentType.choose(answer=input(contentType.prompt))
-                elif isinstance(contentType, DisplayMessage):
-                    print(contentType.text)
-                elif isinstance(contentType, UnknownProgress):
-                    if not contentType.bar:
-                        contentType.bar = ProgressBar(widgets=[BouncingBar()])
-                    with suppress(StopIteration, AttributeError):
-                        # pulse and add a timeout callback
-                        contentType.bar(contentType._iterator()).next()
-                        UI.delayed_display(contentType)
-                    # don't recall the callback
-                    return False
-                else:
-                    logger.error("Unexcepted content type to display to CLI UI: {}".format(contentType))
-                    MainLoop().quit(status_code=1)
-                break
+                return handler(contentType)
             except InputError as e:
                 logger.error(str(e))
-                continue
+
+    def _display_input_text(self, contentType):
+        contentType.run_callback(result=rlinput(contentType.content, contentType.default_input))
+
+    def _display_license_agreement(self, contentType):
+        print(contentType.content)
+        contentType.choose(answer=input(contentType.input))
+
+    def _display_text_with_choices(self, contentType):
+        contentType.choose(answer=input(contentType.prompt))
+
+    def _display_message(self, contentType):
+        print(contentType.text)
+
+    def _display_unknown_progress(self, contentType):
+        if not contentType.bar:
+            contentType.bar = ProgressBar(widgets=[BouncingBar()])
+        with suppress(StopIteration, AttributeError):
+            # pulse and add a timeout callback
+            contentType.bar(contentType._iterator()).next()
+            UI.delayed_display(contentType)
+        # don't recall the callback
+        return False
 
 
 @MainLoop.in_mainloop_thread
@@ -99,6 +202,18 @@ def run_command_for_args(args):
     target.run_for(args)
 
 
+def get_default_args_for_framework(framework):
+    """Return args selecting framework, with all its options set to their default value
+
+    Only the framework parser is built and parsed, rather than going through the whole command line parser.
+    """
+    framework_parser = framework.install_framework_parser(argparse.ArgumentParser().add_subparsers())
+    args = framework_parser.parse_args([])
+    args.category = framework.category.prog_name
+    args.framework = framework.prog_name
+    return args
+
+
 def mangle_args_for_default_framework(args):
     """return the potentially changed args_to_parse for the parser for handling default frameworks
 
@@ -106,12 +221,20 @@ def mangle_args_for_default_framework(args):
     as subparsers can't define default options and are not optional: http://bugs.python.org/issue9253
     """
 
+    # nothing to mangle without any category or framework name
+    if all(arg.startswith('-') for arg in args):
+        return list(args)
+
     result_args = []
     skip_all = False
     pending_args = []
     category_name = None
     framework_completed = False
     args_to_append = []
+    categories = BaseCategory.categories
+    category_names = frozenset(categories)
+    framework_names = frozenset()
+    default_prog = None
 
     for arg in args:
         # --remove is both installed as global and per-framework optional arguments. argparse will only analyze the
@@ -122,8 +245,12 @@ def mangle_args_for_default_framework(args):
             continue
         if not arg.startswith('-') and not skip_all:
             if not category_name:
-                if arg in BaseCategory.categories.keys():
+                if arg in category_names:
                     category_name = arg
+                    current_cat = categories[category_name]
+                    framework_names = frozenset(current_cat.frameworks)
+                    default_fw = current_cat.default_framework
+                    default_prog = default_fw.prog_name if default_fw is not None else None
                     # file global and common options
                     result_args.extend(pending_args)
                     pending_args = []
@@ -134,16 +261,16 @@ def mangle_args_for_default_framework(args):
             elif not framework_completed:
                 # if we found a real framework or not, consider that one. pending_args will be then filed
                 framework_completed = True
-                if arg in BaseCategory.categories[category_name].frameworks.keys():
+                if arg in framework_names:
                     result_args.append(arg)
                     continue
                 # take default framework if any after some sanitization check
-                elif BaseCategory.categories[category_name].default_framework is not None:
+                elif default_prog is not None:
                     # before considering automatically inserting default framework, check that this argument has
                     # some path separator into it. This is to avoid typos in framework selection and selecting default
                     # framework with installation path where we didn't want to.
                     if os.path.sep in arg:
-                        result_args.append(BaseCategory.categories[category_name].default_framework.prog_name)
+                        result_args.append(default_prog)
                     # current arg will be appending in pending_args
                 else:
                     skip_all = True  # will just append everything at the end
@@ -151,8 +278,8 @@ def mangle_args_for_default_framework(args):
 
     # this happened only if there is no argument after the category name
     if category_name and not framework_completed:
-        if BaseCategory.categories[category_name].default_framework is not None:
-            result_args.append(BaseCategory.categories[category_name].default_framework.prog_name)
+        if default_prog is not None:
+            result_args.append(default_prog)
 
     # let the rest in
     result_args.extend(pending_args)
@@ -160,24 +287,43 @@ def mangle_args_for_default_framework(args):
     return result_args
 
 
-def get_frameworks_list_output(args):
+def is_metadata_command(args):
+    """Return if a global option not acting on any framework (like --version) comes before any positional argument"""
+    for arg in args:
+        if not arg.startswith('-'):
+            return False
+        if arg in _METADATA_OPTIONS:
+            return True
+    return False
+
+
+def _sorted_frameworks(predicate=None):
+    """Return (category, framework) pairs matching predicate sorted by category, then framework names
+
+    This prevents a random list at each new program execution. Categories without any matching framework come
+    with None as framework.
     """
-    Get a frameworks list based on the arguments. It returns a string ready to be printed.
+    return sorted(iter_frameworks(predicate),
+                  key=lambda pair: (pair[0]["category_name"], pair[1]["framework_name"] if pair[1] else ""))
+
+
+def iter_frameworks_list_output(args):
+    """
+    Yield the lines of a frameworks list based on the arguments, so that they can be streamed to the output.
     Multiple forms of the frameworks list can ge given:
         - List with all frameworks
         - List with just only installed frameworks
         - List with just installable frameworks
     """
-    categories = list_frameworks()
-    print_result = str()
-
     if args.list or args.list_available:
-        # Sort the categories to prevent a random list at each new program execution
-        for category in sorted(categories, key=lambda cat: cat["category_name"]):
-            if category["category_name"] == "main" and len(category["frameworks"]) == 0:
+        predicate = (lambda framework: framework.is_installable) if args.list_available else None
+        for category_name, pairs in groupby(_sorted_frameworks(predicate), key=lambda pair: pair[0]["category_name"]):
+            pairs = list(pairs)
+            category = pairs[0][0]
+            if category_name == "main" and not category["has_frameworks"]:
                 continue
 
-            print_result += "{}: {}".format(category["category_name"], category["category_description"])
+            category_line = "{}: {}".format(category_name, category["category_description"])
 
             cat_is_installed = str()
             if category["is_installed"] == BaseCategory.NOT_INSTALLED:
@@ -188,38 +334,43 @@ def get_frameworks_list_output(args):
                 cat_is_installed = _("fully installed")
 
             if cat_is_installed:
-                print_result = "{} [{}]".format(print_result, cat_is_installed)
+                category_line = "{} [{}]".format(category_line, cat_is_installed)
 
-            print_result += "\n"
+            yield category_line + "\n"
 
-            # Sort the frameworks to prevent a random list at each new program execution
-            for framework in sorted(category["frameworks"], key=lambda fram: fram["framework_name"]):
-                if args.list_available:
-                    if not framework["is_installable"]:
-                        continue
-
-                print_result += "\t{}: {}".format(framework["framework_name"], framework["framework_description"])
+            for _category, framework in pairs:
+                if framework is None:
+                    continue
+                framework_line = "\t{}: {}".format(framework["framework_name"], framework["framework_description"])
 
                 if not framework["is_installable"]:
-                    print_result = _("{} [not installable on this machine]".format(print_result))
+                    framework_line = "{} [{}]".format(framework_line, _("not installable on this machine"))
                 elif framework["is_installed"]:
-                    print_result = _("{} [installed]".format(print_result))
+                    framework_line = "{} [{}]".format(framework_line, _("installed"))
 
-                print_result += '\n'
+                yield framework_line + "\n"
     elif args.list_installed:
-        # Sort the categories to prevent a random list at each new program execution
-        for category in sorted(categories, key=lambda cat: cat["category_name"]):
-            # Sort the frameworks to prevent a random list at each new program execution
-            for framework in sorted(category["frameworks"], key=lambda fram: fram["framework_name"]):
-                if framework["is_installed"]:
-                    print_result += "{}: {}\n".format(framework["framework_name"],
-                                                      framework["framework_description"])
-                    print_result += "\t{}: {}\n".format(_("path"), framework["install_path"])
+        has_installed_framework = False
+        for _category, framework in _sorted_frameworks(lambda framework: framework.is_installed):
+            if framework is None:
+                continue
+            has_installed_framework = True
+            yield "{}: {}\n".format(framework["framework_name"], framework["framework_description"])
+            yield "\t{}: {}\n".format(_("path"), framework["install_path"])
+
+        if not has_installed_framework:
+            yield _("No frameworks are currently installed")
 
-        if not print_result:
-            print_result = _("No frameworks are currently installed")
 
-    return print_result
+def get_frameworks_list_output(args):
+    """Get a frameworks list based on the arguments. It returns a string ready to be printed."""
+    return "".join(iter_frameworks_list_output(args))
+
+
+@lru_cache(maxsize=None)
+def _parse_version(version):
+    """Return a dotted version string as a tuple of ints"""
+    return tuple(map(int, version.split('.')))
 
 
 def is_first_version_higher(version1, version2):
@@ -228,64 +379,88 @@ def is_first_version_higher(version1, version2):
     elif version1 is None:
         return False
 
-    v1_parts = list(map(int, version1.split('.')))
-    v2_parts = list(map(int, version2.split('.')))
-    for v1, v2 in zip(v1_parts, v2_parts):
-        if v1 > v2:
-            return True
-        elif v1 < v2:
-            return False
-    return len(v1_parts) > len(v2_parts)
+    return _parse_version(version1) > _parse_version(version2)
+
+
+def _stdout_supports_color():
+    """Return if stdout is an interactive terminal able to display colors (only computed once)"""
+    global _SUPPORTS_COLOR
+    if _SUPPORTS_COLOR is None:
+        _SUPPORTS_COLOR = sys.stdout.isatty() and os.environ.get('TERM', '') not in ('', 'dumb')
+    return _SUPPORTS_COLOR
+
+
+def fetch_package_urls(frameworks):
+    """Store the package url of all frameworks, fetching their download pages at once
+
+    This way, we only wait for the slowest download page. Each download page is only fetched once.
+    """
+    if not frameworks:
+        return
+    download_pages = list(dict.fromkeys(framework.download_page for framework in frameworks))
+
+    def store_package_urls(result):
+        for framework in frameworks:
+            # several frameworks can share the same download page: rewind it for each of them
+            page = result[framework.download_page]
+            if page.buffer:
+                page.buffer.seek(0)
+            # don't let one framework failing prevent the others to be checked and the batch to complete
+            try:
+                framework.store_package_url(result)
+            except (Exception, MainLoop.ReturnMainLoop) as e:
+                logger.error("Couldn't check latest version of {}: {}".format(framework.name, e))
+
+    fetched = threading.Event()
+    DownloadCenter([DownloadItem(download_page) for download_page in download_pages], store_package_urls,
+                   download=False,
+                   report=lambda arg: fetched.set() if arg == 'all downloads finished' else None)
+    fetched.wait()
 
 
 def pretty_print_versions(data):
-    max_name_length = max(len(item['framework_name']) for item in data)
-    max_version_length = max(len(item['latest_version']) for item in data)
-    supports_color = os.getenv('TERM') and os.getenv('TERM') != 'dumb'
+    green, red, reset = ('\033[32m', '\033[31m', '\033[m') if _stdout_supports_color() else ('', '', '')
 
-    reset_color = ''
-    if supports_color:
-        reset_color = '\033[m'
+    max_name_length = max_version_length = 0
+    for item in data:
+        max_name_length = max(max_name_length, len(item['framework_name']))
+        max_version_length = max(max_version_length, len(item['latest_version']))
 
+    row_format = ("{{framework_name:<{name_length}}} | "
+                  "Latest Version: {green}{{latest_version}}{reset}{{padding}} | "
+                  "User Version: {red}{{user_version}} +{reset}").format(name_length=max_name_length,
+                                                                         green=green, red=red, reset=reset)
     for item in data:
         latest_version = item['latest_version']
-        user_version = item['user_version']
-        latest_version_color = ''
-        user_version_color = ''
-        symbol = '+'
-        if supports_color:
-            latest_version_color = '\033[32m'
-            user_version_color = '\033[31m'
-
-        latest_version_formatted = f"{latest_version_color}{latest_version}{reset_color}"
-        latest_version_padding = len(latest_version_formatted)
-        latest_version_formatted = latest_version_formatted.ljust(
-            latest_version_padding -
-            len(latest_version) +
-            max_version_length
-        )
-        print(f"{item['framework_name'].ljust(max_name_length)} | "
-              f"Latest Version: {latest_version_formatted} | "
-              f"User Version: {user_version_color}{user_version} {symbol}{reset_color}")
+        print(row_format.format(framework_name=item['framework_name'],
+                                latest_version=latest_version,
+                                padding=' ' * (max_version_length - len(latest_version)),
+                                user_version=item['user_version']))
 
 
 def main(parser):
     """Main entry point of the cli command"""
-    categories_parser = parser.add_subparsers(help='Developer environment', dest="category")
-    for category in BaseCategory.categories.values():
-        category.install_category_parser(categories_parser)
+    categories_parser = add_categories_subparsers(parser)
 
-    argcomplete.autocomplete(parser)
+    if is_completion_mode():
+        # completion needs the whole parser tree
+        categories_parser.install_all_pending_parsers()
+        import argcomplete
+        argcomplete.autocomplete(parser)
     # autocomplete will stop there. Can start more expensive operations now.
 
+    if "--help" in sys.argv[1:]:
+        categories_parser.install_all_pending_parsers()
+
     arg_to_parse = sys.argv[1:]
-    if "--help" not in arg_to_parse:
+    if "--help" not in arg_to_parse and not is_metadata_command(arg_to_parse):
         # manipulate sys.argv for default frameworks:
         arg_to_parse = mangle_args_for_default_framework(arg_to_parse)
     args = parser.parse_args(arg_to_parse)
 
     if args.list or args.list_installed or args.list_available:
-        print(get_frameworks_list_output(args))
+        sys.stdout.writelines(iter_frameworks_list_output(args))
+        print()
         sys.exit(0)
 
     if args.version:
@@ -293,51 +468,51 @@ def main(parser):
         sys.exit(0)
 
     if args.update:
-        frameworks = list_frameworks()
-        installed_frameworks = sorted([
-            {'framework_name': framework['framework_name'],
-             'install_path': framework['install_path'],
-             'category_name': category['category_name']}
-            for category in frameworks
-            for framework in category['frameworks'] if framework['is_installed']
-        ], key=lambda x: x['framework_name'])
-        outdated_frameworks = []
-        for installed_framework in installed_frameworks:
-            category_name = installed_framework['category_name']
-            framework_name = installed_framework['framework_name']
-            if category_name == 'java' or framework_name == 'firefox-dev':
+        installed_frameworks = []
+        for category in list_frameworks():
+            category_name = category['category_name']
+            # java and firefox-dev aren't checked for updates
+            if category_name == 'java':
                 continue
-            install_path = installed_framework['install_path']
-            framework = BaseCategory.categories[category_name].frameworks[framework_name]
+            for framework in category['frameworks']:
+                if framework['is_installed'] and framework['framework_name'] != 'firefox-dev':
+                    framework['category_name'] = category_name
+                    installed_frameworks.append(framework)
+        installed_frameworks.sort(key=itemgetter('framework_name'))
+
+        frameworks_to_check = []
+        for installed_framework in installed_frameworks:
+            framework = installed_framework['framework']
             if framework.supports_update:
-                fetch_package_url = threading.Event()
-                DownloadCenter([DownloadItem(framework.download_page)], framework.store_package_url,
-                               download=False,
-                               report=lambda arg: fetch_package_url.set() if arg == 'all downloads finished' else None)
-                fetch_package_url.wait()
-                user_version = framework.get_current_user_version(install_path)
-                latest_version = framework.get_latest_version()
-                is_outdated = is_first_version_higher(latest_version, user_version) \
-                    if (latest_version is not None and user_version is not None) else False
-                if is_outdated:
-                    outdated_frameworks.append({
-                        'framework_name': framework_name,
-                        'category_name': category_name,
-                        'user_version': user_version,
-                        'latest_version': latest_version,
-                        'is_outdated': is_outdated,
-                    })
+                frameworks_to_check.append((installed_framework, framework))
+
+        fetch_package_urls([framework for installed_framework, framework in frameworks_to_check])
+
+        outdated_frameworks = []
+        for installed_framework, framework in frameworks_to_check:
+            user_version = framework.get_current_user_version(installed_framework['install_path'])
+            latest_version = framework.get_latest_version()
+            is_outdated = is_first_version_higher(latest_version, user_version) \
+                if (latest_version is not None and user_version is not None) else False
+            if is_outdated:
+                outdated_frameworks.append({
+                    'framework': framework,
+                    'framework_name': installed_framework['framework_name'],
+                    'category_name': installed_framework['category_name'],
+                    'user_version': user_version,
+                    'latest_version': latest_version,
+                    'is_outdated': is_outdated,
+                })
         if len(outdated_frameworks) == 0:
             print('All packages are up-to-date.')
             sys.exit(0)
         else:
             pretty_print_versions(outdated_frameworks)
-            for outdated_framework in outdated_frameworks:
-                args = parser.parse_args([outdated_framework['category_name'], outdated_framework['framework_name']])
-                CliUI()
-                run_command_for_args(args)
-                return
-            sys.exit(0)
+            # the main loop quits once the framework setup is done: only the first outdated framework is updated
+            args = get_default_args_for_framework(outdated_frameworks[0]['framework'])
+            CliUI()
+            run_command_for_args(args)
+            return
 
     if not args.category:
         parser.print_help()